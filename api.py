@@ -2,8 +2,11 @@
 AmoCRM API interaction module
 """
 
+import threading
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from functools import lru_cache
 from typing import Any
 from datetime import datetime
 
@@ -12,25 +15,53 @@ from auth import Auth
 from logger import log_event
 
 
+@lru_cache(maxsize=64)
+def _to_unix_timestamp(value: str) -> int | str:
+    """
+    Convert an ISO date string to a unix timestamp, returning the value
+    unchanged if it isn't ISO. Cached since every page of an export
+    uses the same date range.
+    """
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except Exception:
+        return value
+
+
 class AmoCRMAPI:
     """AmoCRM API client"""
 
-    def __init__(self):
-        """Initialize the API client"""
+    def __init__(self, pool_maxsize: int = 10):
+        """
+        Initialize the API client
+
+        pool_maxsize is the number of keep-alive connections kept to the API
+        host, set it to the number of threads making requests.
+        """
         self.auth = Auth()
-        self.last_request_time = 0
+        self.last_request_time = float("-inf")
+        self._rate_lock = threading.Lock()
+        # Keep-alive connection pool, so each page doesn't pay a new TLS handshake
+        self.session = requests.Session()
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        )
 
     def _rate_limit(self):
         """Implement rate limiting for API requests"""
-        current_time = time.time()
-        elapsed = current_time - self.last_request_time
+        # Exports fetch pages from several threads; the lock makes them take
+        # request slots one at a time
+        with self._rate_lock:
+            # Monotonic clock, so wall-clock adjustments can't stall or burst requests
+            current_time = time.monotonic()
+            elapsed = current_time - self.last_request_time
 
-        # If we need to wait to respect rate limit
-        if elapsed < 1.0 / config.settings.max_requests_per_second:
-            sleep_time = (1.0 / config.settings.max_requests_per_second) - elapsed
-            time.sleep(sleep_time)
+            # If we need to wait to respect rate limit
+            if elapsed < 1.0 / config.settings.max_requests_per_second:
+                sleep_time = (1.0 / config.settings.max_requests_per_second) - elapsed
+                time.sleep(sleep_time)
 
-        self.last_request_time = time.time()
+            self.last_request_time = time.monotonic()
 
     def _get_headers(self) -> dict[str, str]:
         """Get the headers for API requests"""
@@ -49,15 +80,21 @@ class AmoCRMAPI:
         headers = self._get_headers()
 
         try:
-            response = requests.request(
+            response = self.session.request(
                 method=method,
                 url=url,
                 headers=headers,
                 params=params,
                 json=data,
+                # A hung connection would otherwise block the export (and a
+                # restart waiting for it) forever
+                timeout=config.settings.request_timeout,
             )
 
             response.raise_for_status()
+            # AmoCRM answers 204 with no body for a page past the end
+            if response.status_code == 204:
+                return {}
             return response.json()
         except requests.exceptions.HTTPError as e:
             error_msg = f"API request error: {e}"
@@ -107,21 +144,9 @@ class AmoCRMAPI:
         # Add updated_at filter if provided
         if date_from:
             # Convert to unix timestamp if needed
-            try:
-                from_ts = int(
-                    datetime.fromisoformat(date_from).timestamp()
-                )
-            except Exception:
-                from_ts = date_from
-            params["updated_at[from]"] = from_ts
+            params["updated_at[from]"] = _to_unix_timestamp(date_from)
         if date_to:
-            try:
-                to_ts = int(
-                    datetime.fromisoformat(date_to).timestamp()
-                )
-            except Exception:
-                to_ts = date_to
-            params["updated_at[to]"] = to_ts
+            params["updated_at[to]"] = _to_unix_timestamp(date_to)
 
         try:
             response = self._make_request("GET", entity_type, params=params)
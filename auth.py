@@ -4,6 +4,7 @@ Authentication module for AmoCRM API using long-term token
 
 import json
 import os
+import threading
 import requests
 from datetime import datetime, timedelta
 
@@ -17,6 +18,8 @@ class Auth:
     def __init__(self):
         """Initialize the authentication module"""
         self.token_data = None
+        # Export fetch threads call get_token() concurrently
+        self._token_lock = threading.Lock()
         self._load_token()
 
     def _load_token(self):
@@ -75,15 +78,20 @@ class Auth:
 
     def get_token(self):
         """Get the current access token"""
-        if not self.token_data or "access_token" not in self.token_data:
-            self._create_token_from_longterm()
-
-            if not self.token_data or "access_token" not in self.token_data:
+        token_data = self.token_data
+        if not token_data or "access_token" not in token_data:
+            # Only one thread creates and saves the token file
+            with self._token_lock:
+                if not self.token_data or "access_token" not in self.token_data:
+                    self._create_token_from_longterm()
+                token_data = self.token_data
+
+            if not token_data or "access_token" not in token_data:
                 raise Exception(
                     "No access token available. Please set LONGTERM_TOKEN in the .env file."
                 )
 
-        token = self.token_data["access_token"]
+        token = token_data["access_token"]
         return token
 
     def validate_token(self):
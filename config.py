@@ -49,9 +49,24 @@ class Settings(BaseSettings):
     page_size: PositiveInt = Field(
         50, alias="PAGE_SIZE", description="Entities per request"
     )
+    request_timeout: PositiveInt = Field(
+        30,
+        alias="REQUEST_TIMEOUT",
+        description="Seconds to wait for an AmoCRM API response",
+    )
     log_retention_days: PositiveInt = Field(
         7, alias="LOG_RETENTION_DAYS", description="Days to keep logs"
     )
+    webhook_retention_days: PositiveInt = Field(
+        30,
+        alias="WEBHOOK_RETENTION_DAYS",
+        description="Days to keep received webhook events",
+    )
+    log_level: str = Field(
+        "info",
+        alias="LOG_LEVEL",
+        description="Minimum log level: 'debug', 'info', 'warning' or 'error'",
+    )
 
     # UI server settings
     ui_host: Optional[str] = Field(
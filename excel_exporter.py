@@ -49,12 +49,7 @@ class ExcelExporter:
                     del query["updated_at"]
 
             # Get all entity data with filter
-            entities_data = {
-                "leads": self.storage.get_entities("leads", query=query) or [],
-                "contacts": self.storage.get_entities("contacts", query=query) or [],
-                "companies": self.storage.get_entities("companies", query=query) or [],
-                "events": self.storage.get_entities("events", query=query) or []
-            }
+            entities_data = self.storage.get_all_entities(query=query)
 
             # Debug log the structure of the first item
             for entity_type, data in entities_data.items():
@@ -111,7 +106,7 @@ class ExcelExporter:
                     if data and len(data) > 0:
                         # Process custom fields and other complex columns
                         log_event("excel", "info", f"Processing data for {entity_type} ({len(data)} items)")
-                        processed_data = self._process_data([item.copy() if item is not None else {} for item in data])
+                        processed_data = self._process_data(data)
 
                         # Debug log the column names after processing
                         if processed_data and len(processed_data) > 0:
@@ -4,11 +4,29 @@ Logging module for AmoCRM exporter
 
 from datetime import datetime
 from typing import Any
+import threading
+
+import config
 
 # This is a circular import if we import Storage directly, so we'll initialize storage later
 storage = None
 
 
+_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+_min_level = _LEVELS.get(config.settings.log_level.lower(), _LEVELS["info"])
+
+
+# Bumped after storage accepts an event; get_recent_logs() results are cached per version
+_logs_version = 0
+_recent_logs_cache: dict[str, Any] = {"version": -1, "results": {}}
+_recent_logs_lock = threading.Lock()
+
+
+def is_enabled_for(level: str) -> bool:
+    """Check if events of the given level pass the configured LOG_LEVEL"""
+    return _LEVELS.get(level, _LEVELS["error"]) >= _min_level
+
+
 def init_storage(storage_instance):
     """Initialize the storage instance"""
     global storage
@@ -33,7 +51,12 @@ def log_event(
     Returns:
         bool: True if the log was successfully written, False otherwise
     """
-    timestamp = datetime.now().isoformat()
+    # Drop events below LOG_LEVEL before doing any formatting or I/O
+    if not is_enabled_for(level):
+        return True
+
+    # Stored as a BSON date so the logs TTL index can expire it
+    timestamp = datetime.now()
 
     log_entry = {
         "timestamp": timestamp,
@@ -47,7 +70,7 @@ def log_event(
 
     # Print to console
     print(
-        f"[{timestamp}] [{component}] [{level.upper()}] {message}"
+        f"[{timestamp.isoformat()}] [{component}] [{level.upper()}] {message}"
     )
 
     # If storage is not initialized, store log in temporary buffer
@@ -55,7 +78,17 @@ def log_event(
         return _store_log_in_buffer(log_entry)
 
     # Write to log file using storage module
-    return storage.add_log_entry(log_entry)
+    if not storage.add_log_entry(log_entry):
+        return False
+    _bump_logs_version()
+    return True
+
+
+def _bump_logs_version():
+    """Invalidate cached get_recent_logs() results once an entry was accepted"""
+    global _logs_version
+    with _recent_logs_lock:
+        _logs_version += 1
 
 
 # Buffer for logs before storage is initialized
@@ -80,6 +113,7 @@ def flush_log_buffer():
         storage.add_log_entry(log_entry)
 
     _log_buffer = []
+    _bump_logs_version()
 
 
 def get_recent_logs(count=100, entity=None, level=None):
@@ -94,6 +128,12 @@ def get_recent_logs(count=100, entity=None, level=None):
             logs = [log for log in logs if log.get('level') == level]
         return logs
 
+    key = (count, entity, level)
+    with _recent_logs_lock:
+        version = _logs_version
+        if _recent_logs_cache["version"] == version and key in _recent_logs_cache["results"]:
+            return _recent_logs_cache["results"][key]
+
     print("DEBUG: Getting logs from storage")
     try:
         # Build filter query
@@ -103,8 +143,17 @@ def get_recent_logs(count=100, entity=None, level=None):
         if level:
             query['level'] = level
 
-        logs = storage.get_entities("logs", query=query, limit=count)
+        # details can hold whole webhook payloads and the log view only
+        # shows the message, so leave them out of the tail read
+        logs = storage.get_entities(
+            "logs", query=query, limit=count, projection={"details": 0}
+        )
         print(f"DEBUG: Retrieved {len(logs)} logs from MongoDB")
+        with _recent_logs_lock:
+            if _recent_logs_cache["version"] != version:
+                _recent_logs_cache["version"] = version
+                _recent_logs_cache["results"] = {}
+            _recent_logs_cache["results"][key] = logs
         return logs
     except Exception as e:
         print(f"DEBUG: Error getting logs from storage: {e}")
@@ -2,18 +2,26 @@
 Modern web interface for AmoCRM exporter using FastAPI
 """
 
+import asyncio
+import functools
 import webbrowser
 import hmac
 import hashlib
 import os
+import re
+import threading
+import time
 from enum import Enum
 from typing import Callable, Dict, Any, Optional
 from datetime import datetime
-from pymongo import MongoClient
 
-from fastapi import FastAPI, HTTPException, Request, Header, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Request, Response, Header, Query
+from fastapi.responses import (
+    HTMLResponse, JSONResponse, FileResponse, ORJSONResponse, StreamingResponse
+)
 from fastapi.templating import Jinja2Templates
+import jinja2
+import orjson
 import uvicorn
 
 from logger import log_event
@@ -43,13 +51,33 @@ class EntityType(str, Enum):
     EVENTS = "events"
 
 
+# Read/write size used when streaming Excel exports (default is 64 KiB)
+EXCEL_CHUNK_SIZE = 1024 * 1024
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# The dashboard polls every 5 seconds, which is exactly uvicorn's default
+# keep-alive, so idle connections were closed right before each poll
+KEEP_ALIVE_TIMEOUT = 15
+
+# Seconds that /stats, /export-status and /status reuse a computed result
+STATUS_CACHE_TTL = 1.0
+
+
 # Create global instances
 storage = Storage()
 logger.init_storage(storage)
-exporter = ParallelExporter()
+exporter = ParallelExporter(storage=storage)
 excel_exporter = ExcelExporter(storage)
 sheets_exporter = SheetsExporter(storage)
 
+# Single entity types (everything except ALL) and the export each one starts
+ENTITY_EXPORTS: dict[EntityType, Callable] = {
+    EntityType.DEALS: exporter.export_deals,
+    EntityType.CONTACTS: exporter.export_contacts,
+    EntityType.COMPANIES: exporter.export_companies,
+    EntityType.EVENTS: exporter.export_events,
+}
+
 # Auto-continue exports that were still marked as running
 def continue_running_exports():
     """Check for and continue any exports that were running when server was stopped"""
@@ -73,27 +101,64 @@ app = FastAPI(
     title="AmoCRM Data Exporter",
     description="Modern web interface for AmoCRM data export",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 
-# Setup templates
-templates = Jinja2Templates(directory="templates")
+# Setup templates: compile once per process and keep the compiled
+# bytecode on disk so restarts skip template compilation as well
+TEMPLATE_CACHE_DIR = ".jinja_cache"
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+templates = Jinja2Templates(
+    env=jinja2.Environment(
+        loader=jinja2.FileSystemLoader("templates"),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+        auto_reload=False,
+        autoescape=True,
+    )
+)
+
+
+_STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.S)
+
+
+def _minify_css(css: str) -> str:
+    """Strip comments and the whitespace CSS doesn't need"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,])\s*", r"\1", css).strip()
+
+
+@functools.cache
+def _render_index() -> tuple[bytes, str]:
+    """Render and encode the main UI once, it has no per-request content"""
+    html = templates.get_template("index.html").render()
+    html = _STYLE_BLOCK.sub(
+        lambda m: m.group(1) + _minify_css(m.group(2)) + m.group(3), html
+    )
+    body = html.encode("utf-8")
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    return body, etag
 
 
 @app.get("/", response_class=HTMLResponse)
 async def get_root(request: Request):
-    """Render the main UI"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    """Render the main UI, answering 304 when the browser has the same page"""
+    body, etag = _render_index()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(body, headers=headers)
 
 
 @app.get("/stats")
-async def stats() -> dict:
+def stats() -> dict:
     """Return statistics"""
-    return get_stats()
+    return _cached_stats()
 
 
 @app.get("/logs")
-async def logs(entity: str | None = None, level: str | None = None) -> dict:
+def logs(entity: str | None = None, level: str | None = None) -> dict:
     """Return recent logs with optional filtering by entity type and log level"""
     try:
         logs = logger.get_recent_logs(count=30, entity=entity, level=level)
@@ -104,36 +169,32 @@ async def logs(entity: str | None = None, level: str | None = None) -> dict:
 
 
 @app.post("/fetch/all")
-async def fetch_all_handler(
+def fetch_all_handler(
     date_from: str = Query(None),
     date_to: str = Query(None)
 ) -> dict:
-    await fetch_all(date_from, date_to)
+    fetch_all(date_from, date_to)
     return {"success": True}
 
 
 @app.post("/fetch/{entity}")
-async def fetch_entity_handler(
+def fetch_entity_handler(
     entity: EntityType,
     date_from: str = Query(None),
     date_to: str = Query(None)
 ) -> dict:
-    if entity not in [
-        EntityType.DEALS,
-        EntityType.CONTACTS,
-        EntityType.COMPANIES,
-        EntityType.EVENTS,
-    ]:
+    if entity not in ENTITY_EXPORTS:
         raise HTTPException(status_code=400, detail="Invalid entity type")
-    await fetch_entity(entity, date_from, date_to)
+    fetch_entity(entity, date_from, date_to)
     return {"success": True}
 
 
 @app.post("/state/clear-running")
-async def clear_running_exports() -> dict:
+def clear_running_exports() -> dict:
     """Clear all running exports to allow server restart"""
     try:
         exporter.state_manager.clear_running_exports()
+        _invalidate_status_cache()
         log_event("server", "info", "Cleared all running exports")
         return {"success": True, "message": "All running exports cleared"}
     except Exception as e:
@@ -142,10 +203,11 @@ async def clear_running_exports() -> dict:
 
 
 @app.post("/state/reset")
-async def reset_all_state() -> dict:
+def reset_all_state() -> dict:
     """Reset all export state including running exports"""
     try:
         exporter.state_manager.reset_all_state()
+        _invalidate_status_cache()
         log_event("server", "info", "Reset all export state")
         return {"success": True, "message": "All export state has been reset"}
     except Exception as e:
@@ -154,22 +216,33 @@ async def reset_all_state() -> dict:
 
 
 @app.get("/export-status")
-async def export_status() -> dict:
+def export_status() -> dict:
     """Return the status of all exports"""
-    return {"status": exporter.get_export_status()}
+    return {"status": _cached_export_status()}
+
+
+@app.get("/status")
+def status() -> dict:
+    """Return statistics and export status in one response for dashboard polling"""
+    return {"stats": _cached_stats(), "status": _cached_export_status()}
 
 
 @app.post("/export/restart/{entity}")
-async def restart_export_handler(entity: EntityType) -> dict:
+def restart_export_handler(entity: EntityType) -> dict:
     """Forcibly restart an export regardless of its current state"""
     try:
         if entity == EntityType.ALL:
-            for e in [EntityType.DEALS, EntityType.CONTACTS, EntityType.COMPANIES, EntityType.EVENTS]:
+            # Signal every run first, so the old runs wind down together
+            # instead of one per restart_export call
+            exporter.stop_all_exports()
+            for e in ENTITY_EXPORTS:
                 exporter.restart_export(e.value)
+            _invalidate_status_cache()
             log_event("server", "info", "Restarting all exports")
             return {"success": True, "message": "All exports are being restarted"}
         else:
             exporter.restart_export(entity.value)
+            _invalidate_status_cache()
             log_event("server", "info", f"Restarting {entity.value} export")
             return {"success": True, "message": f"{entity.value} export is being restarted"}
     except Exception as e:
@@ -178,15 +251,17 @@ async def restart_export_handler(entity: EntityType) -> dict:
 
 
 @app.post("/export/stop/{entity}")
-async def stop_export_handler(entity: EntityType) -> dict:
+def stop_export_handler(entity: EntityType) -> dict:
     """Stop a running export"""
     try:
         if entity == EntityType.ALL:
             exporter.stop_all_exports()
+            _invalidate_status_cache()
             log_event("server", "info", "Stopping all exports")
             return {"success": True, "message": "All exports are being stopped"}
         else:
             exporter.stop_export(entity.value)
+            _invalidate_status_cache()
             log_event("server", "info", f"Stopping {entity.value} export")
             return {"success": True, "message": f"{entity.value} export is being stopped"}
     except Exception as e:
@@ -195,16 +270,21 @@ async def stop_export_handler(entity: EntityType) -> dict:
 
 
 @app.post("/export/resume/{entity}")
-async def resume_export_handler(entity: EntityType) -> dict:
+def resume_export_handler(entity: EntityType) -> dict:
     """Resume an export from the last saved page without resetting state"""
     try:
         if entity == EntityType.ALL:
-            for e in [EntityType.DEALS, EntityType.CONTACTS, EntityType.COMPANIES, EntityType.EVENTS]:
+            # Signal every run first, so the old runs wind down together
+            # instead of one per resume_export call
+            exporter.stop_all_exports()
+            for e in ENTITY_EXPORTS:
                 exporter.resume_export(e.value)
+            _invalidate_status_cache()
             log_event("server", "info", "Resuming all exports")
             return {"success": True, "message": "All exports are being resumed"}
         else:
             exporter.resume_export(entity.value)
+            _invalidate_status_cache()
             log_event("server", "info", f"Resuming {entity.value} export")
             return {"success": True, "message": f"{entity.value} export is being resumed"}
     except Exception as e:
@@ -213,7 +293,7 @@ async def resume_export_handler(entity: EntityType) -> dict:
 
 
 @app.get("/export/excel")
-async def export_excel_handler(
+def export_excel_handler(
     date_from: str = Query(None),
     date_to: str = Query(None)
 ):
@@ -224,18 +304,22 @@ async def export_excel_handler(
         log_event(
             "server", "info", f"Excel export generated: {excel_file}"
         )
-        return FileResponse(
+        response = FileResponse(
             path=excel_file,
             filename=os.path.basename(excel_file),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            media_type=XLSX_MEDIA_TYPE,
+            stat_result=os.stat(excel_file),
         )
+        # Workbooks are several MB, send them in large reads/writes
+        response.chunk_size = EXCEL_CHUNK_SIZE
+        return response
     except Exception as e:
         log_event("server", "error", f"Error generating Excel export: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/export/sheets")
-async def export_sheets_handler(
+def export_sheets_handler(
     date_from: str = Query(None),
     date_to: str = Query(None)
 ):
@@ -252,44 +336,77 @@ async def export_sheets_handler(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _ttl_cache(seconds: float):
+    """
+    Cache the result of a function without arguments for a number of seconds
+
+    Concurrent callers wait for a single computation instead of each
+    running it. The wrapper has an invalidate() method to drop the value.
+    """
+    def decorator(func: Callable) -> Callable:
+        lock = threading.Lock()
+        entry: list[Any] = [float("-inf"), None]
+
+        @functools.wraps(func)
+        def wrapper():
+            with lock:
+                if time.monotonic() - entry[0] >= seconds:
+                    entry[1] = func()
+                    entry[0] = time.monotonic()
+                return entry[1]
+
+        def invalidate():
+            with lock:
+                entry[0] = float("-inf")
+
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
+
+
+@_ttl_cache(seconds=STATUS_CACHE_TTL)
+def _cached_stats() -> dict:
+    """get_stats() shared by all dashboard tabs polling in the same second"""
+    return get_stats()
+
+
+@_ttl_cache(seconds=STATUS_CACHE_TTL)
+def _cached_export_status() -> dict:
+    """exporter.get_export_status() shared by all polling dashboard tabs"""
+    return exporter.get_export_status()
+
+
+def _invalidate_status_cache():
+    """Make the next poll see the effect of a start/stop/reset right away"""
+    _cached_stats.invalidate()
+    _cached_export_status.invalidate()
+
+
 def get_stats() -> dict:
     """Get current statistics"""
     try:
-        deals = len(storage.get_entities("leads"))
-        contacts = len(storage.get_entities("contacts"))
-        companies = len(storage.get_entities("companies"))
-        events = len(storage.get_entities("events"))
-
-        return {
-            "deals": deals,
-            "contacts": contacts,
-            "companies": companies,
-            "events": events,
-        }
+        return storage.get_statistics()
     except Exception as e:
         log_event("server", "error", f"Error getting stats: {e}")
         return {"deals": 0, "contacts": 0, "companies": 0, "events": 0}
 
 
-async def fetch_all(date_from=None, date_to=None):
+def fetch_all(date_from=None, date_to=None):
     try:
         exporter.export_all(date_from=date_from, date_to=date_to)
+        _invalidate_status_cache()
         log_event("server", "info", "Started export of all data")
     except Exception as e:
         log_event("server", "error", f"Error starting export: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def fetch_entity(entity: EntityType, date_from=None, date_to=None):
+def fetch_entity(entity: EntityType, date_from=None, date_to=None):
     try:
-        export_methods: dict[EntityType, Callable] = {
-            EntityType.DEALS: exporter.export_deals,
-            EntityType.CONTACTS: exporter.export_contacts,
-            EntityType.COMPANIES: exporter.export_companies,
-            EntityType.EVENTS: exporter.export_events,
-        }
-        if entity in export_methods:
-            export_methods[entity](date_from=date_from, date_to=date_to)
+        export_method = ENTITY_EXPORTS.get(entity)
+        if export_method:
+            export_method(date_from=date_from, date_to=date_to)
+            _invalidate_status_cache()
             log_event(
                 "server", "info", f"Started export of {entity.value}"
             )
@@ -307,12 +424,6 @@ async def fetch_entity(entity: EntityType, date_from=None, date_to=None):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def get_mongo_webhook_collection():
-    client = MongoClient(config.settings.mongodb_uri)
-    db = client[config.settings.mongodb_db]
-    return db["webhook_events"]
-
-
 def verify_webhook_signature(signature: Optional[str], body: bytes) -> bool:
     if not hasattr(config.settings, 'webhook_secret') or not config.settings.webhook_secret or not signature:
         return False
@@ -323,16 +434,28 @@ def verify_webhook_signature(signature: Optional[str], body: bytes) -> bool:
     ).hexdigest()
     return hmac.compare_digest(expected_signature, signature)
 
-async def store_webhook_event(event_data: Dict[str, Any]) -> bool:
+def store_webhook_event(event_data: Dict[str, Any]) -> bool:
     try:
-        event_data["_received_at"] = datetime.now().isoformat()
-        collection = get_mongo_webhook_collection()
-        collection.insert_one(event_data)
-        return True
+        # Stored as a BSON date so the webhook_events TTL index can expire it
+        event_data["_received_at"] = datetime.now()
+        return storage.append_entity("webhook_events", event_data)
     except Exception as e:
         log_event("webhook", "error", f"Error storing webhook event in MongoDB: {e}")
         return False
 
+# Webhook event_type -> (entity name, export to trigger); add more entity types here
+WEBHOOK_EXPORTS: dict[str, tuple[str, Callable]] = {
+    f"{action}_{event}": (name, export_method)
+    for event, name, export_method in (
+        ("lead", "deals", exporter.export_deals),
+        ("contact", "contacts", exporter.export_contacts),
+        ("company", "companies", exporter.export_companies),
+        ("event", "events", exporter.export_events),
+    )
+    for action in ("add", "update", "delete")
+}
+
+
 @app.post("/webhook")
 async def webhook_handler(request: Request, x_signature: Optional[str] = Header(None)):
     body = await request.body()
@@ -344,35 +467,42 @@ async def webhook_handler(request: Request, x_signature: Optional[str] = Header(
         webhook_data = await request.json()
         event_type = webhook_data.get("event_type")
         log_event("webhook", "info", f"Received webhook: {event_type}", details=webhook_data)
-        await store_webhook_event(webhook_data)
+        await asyncio.to_thread(store_webhook_event, webhook_data)
         # Handle all main entity types
-        if event_type in ("update_lead", "add_lead", "delete_lead"):
-            exporter.export_deals()
-            log_event("webhook", "info", "Triggered deals export due to webhook")
-        elif event_type in ("update_contact", "add_contact", "delete_contact"):
-            exporter.export_contacts()
-            log_event("webhook", "info", "Triggered contacts export due to webhook")
-        elif event_type in ("update_company", "add_company", "delete_company"):
-            exporter.export_companies()
-            log_event("webhook", "info", "Triggered companies export due to webhook")
-        elif event_type in ("update_event", "add_event", "delete_event"):
-            exporter.export_events()
-            log_event("webhook", "info", "Triggered events export due to webhook")
-        # You can add more entity types here as needed
+        target = WEBHOOK_EXPORTS.get(event_type)
+        if target:
+            name, export_method = target
+            await asyncio.to_thread(export_method)
+            _invalidate_status_cache()
+            log_event("webhook", "info", f"Triggered {name} export due to webhook")
         return {"success": True, "event_type": event_type}
     except Exception as e:
         log_event("webhook", "error", f"Error processing webhook: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-@app.get("/webhooks")
-async def get_webhook_events():
+def _stream_webhook_events(cursor):
+    """Serialize webhook events one by one as {"events": [...], "count": N}"""
+    count = 0
+    yield b'{"events":['
     try:
-        collection = get_mongo_webhook_collection()
-        events = list(collection.find({}, {"_id": 0}))
+        for event in cursor:
+            if count:
+                yield b","
+            yield orjson.dumps(event)
+            count += 1
     except Exception as e:
         log_event("webhook", "error", f"Error reading webhook events from MongoDB: {e}")
-        events = []
-    return {"events": events, "count": len(events)}
+    yield b'],"count":%d}' % count
+
+
+@app.get("/webhooks")
+def get_webhook_events():
+    # Larger batches than the default first batch of 101 mean fewer
+    # getMore round-trips while the response is streamed
+    cursor = storage.get_entities("webhook_events", as_list=False, batch_size=1000)
+    return StreamingResponse(
+        _stream_webhook_events(cursor), media_type="application/json"
+    )
 
 def run_server(host: str = "0.0.0.0", port: int = 8000):
     """Run the FastAPI server"""
@@ -384,7 +514,15 @@ def run_server(host: str = "0.0.0.0", port: int = 8000):
         webbrowser.open(f"http://localhost:{port}")
 
         # Start server
-        uvicorn.run(app, host=host, port=port)
+        # "auto" picks uvloop and httptools when installed (uvicorn[standard])
+        uvicorn.run(
+            app,
+            host=host,
+            port=port,
+            loop="auto",
+            http="auto",
+            timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+        )
     except Exception as e:
         log_event("server", "error", f"Server error: {e}")
         raise
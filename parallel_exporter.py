@@ -2,29 +2,107 @@
 Parallel exporter for AmoCRM data
 """
 
+import queue
+import random
 import threading
-import time
-from typing import Any, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, NamedTuple
 
 from api import AmoCRMAPI
 from storage import Storage
-from state_manager import StateManager
+from state_manager import get_state_manager
 from logger import log_event
 
+# Batches that may wait for the writer thread before fetching pauses
+WRITE_QUEUE_SIZE = 4
+
+# Upper bound in seconds for the wait before retrying a failed page
+MAX_RETRY_DELAY = 60
+
+# Seconds restart/resume wait for the replaced run to exit. Its in-flight
+# page is bounded by REQUEST_TIMEOUT; a run still alive after this can no
+# longer record progress, so the new run starts anyway.
+RUN_JOIN_TIMEOUT = 60
+
+
+def _date_range_key(date_from: str = None, date_to: str = None) -> str:
+    """Fingerprint of an export's date range, '|' when unfiltered"""
+    return f"{date_from or ''}|{date_to or ''}"
+
+
+def _retry_delay(error: Exception, failures: int) -> float:
+    """
+    Seconds to wait before retrying a failed page: the server's Retry-After
+    if it sent one, otherwise exponential backoff with full jitter
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_DELAY)
+        except ValueError:
+            pass  # HTTP-date form, fall back to backoff
+    # 0.5 * 2 ** 7 already exceeds MAX_RETRY_DELAY; capping the exponent
+    # keeps the float from overflowing after ~1024 failures
+    return random.uniform(0, min(MAX_RETRY_DELAY, 0.5 * 2 ** min(failures, 7)))
+
+
+def _is_last_page(future: Future) -> bool:
+    """Whether a finished page request returned a short (final) page"""
+    if not future.done() or future.cancelled() or future.exception() is not None:
+        return False
+    _, has_more = future.result()
+    return not has_more
+
+
+class _ExportRun(NamedTuple):
+    """Thread of a running export, the event that stops it and its date range"""
+
+    thread: threading.Thread
+    stop_event: threading.Event
+    date_range: str
+
 
 class ParallelExporter:
     """Handles parallel data export from AmoCRM"""
 
-    def __init__(self, max_workers: int = 4):
-        """Initialize the parallel exporter"""
+    # Entity type -> name of the AmoCRMAPI method returning one page of it
+    _PAGE_GETTERS = {
+        "leads": "get_deals_page",
+        "contacts": "get_contacts_page",
+        "companies": "get_companies_page",
+        "events": "get_events_page",
+    }
+
+    # Entity type -> name of the method that starts its export
+    _EXPORT_METHODS = {
+        "leads": "export_deals",
+        "contacts": "export_contacts",
+        "companies": "export_companies",
+        "events": "export_events",
+    }
+
+    def __init__(self, max_workers: int = 4, storage: Storage | None = None):
+        """
+        Initialize the parallel exporter
+
+        max_workers is the number of pages each export fetches concurrently.
+        Pass storage to share an existing Storage (and its log buffer and
+        count cache) instead of creating a new one.
+        """
         self.max_workers = max_workers
-        self.api = AmoCRMAPI()
-        self.storage = Storage()
-        import logger
-        logger.init_storage(self.storage)
-        self.state_manager = StateManager()
-        self.threads = {}
-        self.stop_flags = {}
+        # Enough pooled connections for every export's prefetch window
+        self.api = AmoCRMAPI(pool_maxsize=max_workers * len(self._PAGE_GETTERS))
+        if storage is None:
+            storage = Storage()
+            import logger
+            logger.init_storage(storage)
+        self.storage = storage
+        self.state_manager = get_state_manager()
+        # Live export runs by entity type
+        self._runs: dict[str, _ExportRun] = {}
+        # Serializes starts so concurrent requests can't launch duplicate threads
+        self._start_lock = threading.Lock()
 
         # Verify running exports from previous session
         self._validate_running_exports()
@@ -35,21 +113,20 @@ class ParallelExporter:
         # Validate exports against known entity types
         self.state_manager.verify_running_exports(valid_entity_types)
 
-        # Clean up any thread references as they aren't valid after restart
-        self.threads = {}
+        # Clean up any run references as they aren't valid after restart
+        self._runs = {}
 
     def export_deals(
         self,
         force_restart: bool = False,
         batch_save: bool = True,
-        batch_size: int = 10,
+        batch_size: int = 1000,
         date_from: str = None,
         date_to: str = None,
     ):
         """Export deals in a separate thread"""
         self._start_export_thread(
             "leads",
-            self._export_deals_worker,
             force_restart,
             batch_save,
             batch_size,
@@ -61,14 +138,13 @@ class ParallelExporter:
         self,
         force_restart: bool = False,
         batch_save: bool = True,
-        batch_size: int = 10,
+        batch_size: int = 1000,
         date_from: str = None,
         date_to: str = None,
     ):
         """Export contacts in a separate thread"""
         self._start_export_thread(
             "contacts",
-            self._export_contacts_worker,
             force_restart,
             batch_save,
             batch_size,
@@ -80,14 +156,13 @@ class ParallelExporter:
         self,
         force_restart: bool = False,
         batch_save: bool = True,
-        batch_size: int = 10,
+        batch_size: int = 1000,
         date_from: str = None,
         date_to: str = None,
     ):
         """Export companies in a separate thread"""
         self._start_export_thread(
             "companies",
-            self._export_companies_worker,
             force_restart,
             batch_save,
             batch_size,
@@ -99,14 +174,13 @@ class ParallelExporter:
         self,
         force_restart: bool = False,
         batch_save: bool = True,
-        batch_size: int = 10,
+        batch_size: int = 1000,
         date_from: str = None,
         date_to: str = None,
     ):
         """Export events in a separate thread"""
         self._start_export_thread(
             "events",
-            self._export_events_worker,
             force_restart,
             batch_save,
             batch_size,
@@ -118,44 +192,29 @@ class ParallelExporter:
         self,
         force_restart: bool = False,
         batch_save: bool = True,
-        batch_size: int = 10,
+        batch_size: int = 1000,
         date_from: str = None,
         date_to: str = None,
     ):
         """Export all entity types in parallel"""
-        self.export_deals(
-            force_restart=force_restart,
-            batch_save=batch_save,
-            batch_size=batch_size,
-            date_from=date_from,
-            date_to=date_to,
-        )
-        self.export_contacts(
-            force_restart=force_restart,
-            batch_save=batch_save,
-            batch_size=batch_size,
-            date_from=date_from,
-            date_to=date_to,
-        )
-        self.export_companies(
-            force_restart=force_restart,
-            batch_save=batch_save,
-            batch_size=batch_size,
-            date_from=date_from,
-            date_to=date_to,
-        )
-        self.export_events(
-            force_restart=force_restart,
-            batch_save=batch_save,
-            batch_size=batch_size,
-            date_from=date_from,
-            date_to=date_to,
-        )
+        with self._start_lock:
+            ranges = {
+                entity_type: self._resolve_date_range(entity_type, date_from, date_to)
+                for entity_type in self._PAGE_GETTERS
+            }
+            ready = [
+                entity_type
+                for entity_type, (run_from, run_to) in ranges.items()
+                if self._prepare_run(entity_type, force_restart, run_from, run_to)
+            ]
+            # One state update marks every export that is about to start
+            self.state_manager.mark_exports_running(ready)
+            for entity_type in ready:
+                self._launch_run(entity_type, batch_save, batch_size, *ranges[entity_type])
 
     def _start_export_thread(
         self,
         entity_type: str,
-        worker_func: Callable,
         force_restart: bool,
         batch_save: bool,
         batch_size: int,
@@ -163,150 +222,203 @@ class ParallelExporter:
         date_to: str = None,
     ):
         """Start a new export thread if one is not already running"""
-        # Check if export is already running - use direct MongoDB check
-        if self.state_manager.is_export_running_in_db(entity_type):
-            # Check if the thread actually exists
-            if entity_type in self.threads and self.threads[entity_type].is_alive():
+        with self._start_lock:
+            date_from, date_to = self._resolve_date_range(entity_type, date_from, date_to)
+            if self._prepare_run(entity_type, force_restart, date_from, date_to):
+                self.state_manager.mark_export_running(entity_type)
+                self._launch_run(
+                    entity_type, batch_save, batch_size, date_from, date_to
+                )
+
+    def _resolve_date_range(
+        self, entity_type: str, date_from: str = None, date_to: str = None
+    ) -> tuple[str | None, str | None]:
+        """
+        Date range for a new run. A request without dates (webhooks, resume)
+        continues an unfinished export with the range it was started with;
+        explicit dates are used as given.
+        """
+        if date_from or date_to:
+            return date_from, date_to
+        saved_range = self.state_manager.get_export_date_range(entity_type)
+        if (
+            saved_range is not None
+            and self.state_manager.get_last_page(entity_type) > 0
+            and not self.state_manager.is_export_completed(entity_type)
+        ):
+            return saved_range
+        return None, None
+
+    def _prepare_run(
+        self,
+        entity_type: str,
+        force_restart: bool,
+        date_from: str = None,
+        date_to: str = None,
+    ) -> bool:
+        """
+        Check that an export can start and prepare its state, called with
+        _start_lock held. Returns False if the export is already running.
+        """
+        # A live thread means the export is running; bursts of webhooks for
+        # the same entity are coalesced here without touching MongoDB
+        date_range = _date_range_key(date_from, date_to)
+        run = self._runs.get(entity_type)
+        if run is not None and run.thread.is_alive():
+            if run.date_range == date_range:
                 log_event(
                     "exporter",
                     "warning",
                     f"{entity_type} export is already running",
                 )
-                return
             else:
-                # Thread reference doesn't exist or thread is dead, but state says it's running
-                # This can happen after server restart - fix the state
                 log_event(
                     "exporter",
                     "warning",
-                    f"{entity_type} marked as running but no thread exists - fixing state",
+                    f"{entity_type} export is already running for date range "
+                    f"{run.date_range!r}, ignoring request for {date_range!r}; "
+                    f"restart the export to change the range",
                 )
-                # Stop it in the state so we can restart it properly
-                self.state_manager.mark_export_stopped(entity_type)
+            return False
+
+        if self.state_manager.is_export_running_in_db(entity_type):
+            # No live thread but state says it's running
+            # This can happen after server restart - fix the state
+            log_event(
+                "exporter",
+                "warning",
+                f"{entity_type} marked as running but no thread exists - fixing state",
+            )
+            # Stop it in the state so we can restart it properly
+            self.state_manager.mark_export_stopped(entity_type)
 
         # Reset export state if forced restart
         if force_restart:
             self.state_manager.reset_export_state(entity_type)
+        return True
 
-        # Initialize stop flag
-        self.stop_flags[entity_type] = False
-
-        # Mark export as running
-        self.state_manager.mark_export_running(entity_type)
+    def _launch_run(
+        self,
+        entity_type: str,
+        batch_save: bool,
+        batch_size: int,
+        date_from: str = None,
+        date_to: str = None,
+    ):
+        """Start the worker thread of a prepared export, called with _start_lock held"""
+        # Each run gets its own stop event, so a stop requested for a run
+        # being replaced by a restart can't be undone by the new run
+        stop_event = threading.Event()
 
         # Start the export thread
         thread = threading.Thread(
-            target=worker_func,
-            args=(batch_save, batch_size, date_from, date_to),
+            target=self._export_worker,
+            args=(entity_type, stop_event, batch_save, batch_size, date_from, date_to),
             name=f"{entity_type}_export_thread",
         )
         thread.daemon = True
         thread.start()
 
-        # Store the thread reference
-        self.threads[entity_type] = thread
+        # Store the run so it can be found and stopped
+        self._runs[entity_type] = _ExportRun(
+            thread, stop_event, _date_range_key(date_from, date_to)
+        )
 
         log_event("exporter", "info", f"Started {entity_type} export thread")
 
-    def _export_deals_worker(
-        self, batch_save: bool = True, batch_size: int = 10, date_from: str = None, date_to: str = None
-    ):
-        """Worker function for exporting deals"""
-        try:
-            log_event("exporter", "warning", "Starting deals export (test)")
-            self._export_entities_worker(
-                "leads", self.api.get_deals_page, batch_save, batch_size, date_from, date_to
-            )
-        except Exception as e:
-            log_event(
-                "exporter", "error", f"Error in deals export worker: {e}"
-            )
-        finally:
-            self.state_manager.mark_export_stopped("leads")
-            # Clean up thread reference
-            if "leads" in self.threads:
-                del self.threads["leads"]
-
-    def _export_contacts_worker(
-        self, batch_save: bool = True, batch_size: int = 10, date_from: str = None, date_to: str = None
-    ):
-        """Worker function for exporting contacts"""
-        try:
-            self._export_entities_worker(
-                "contacts", self.api.get_contacts_page, batch_save, batch_size, date_from, date_to
-            )
-        except Exception as e:
-            log_event(
-                "exporter", "error", f"Error in contacts export worker: {e}"
-            )
-        finally:
-            self.state_manager.mark_export_stopped("contacts")
-            # Clean up thread reference
-            if "contacts" in self.threads:
-                del self.threads["contacts"]
-
-    def _export_companies_worker(
-        self, batch_save: bool = True, batch_size: int = 10, date_from: str = None, date_to: str = None
+    def _export_worker(
+        self,
+        entity_type: str,
+        stop_event: threading.Event,
+        batch_save: bool = True,
+        batch_size: int = 1000,
+        date_from: str = None,
+        date_to: str = None,
     ):
-        """Worker function for exporting companies"""
+        """Thread target running the export of one entity type"""
         try:
+            page_getter = getattr(self.api, self._PAGE_GETTERS[entity_type])
             self._export_entities_worker(
-                "companies",
-                self.api.get_companies_page,
-                batch_save,
-                batch_size,
-                date_from,
-                date_to,
+                entity_type, page_getter, stop_event, batch_save, batch_size, date_from, date_to
             )
         except Exception as e:
             log_event(
-                "exporter", "error", f"Error in companies export worker: {e}"
+                "exporter", "error", f"Error in {entity_type} export worker: {e}"
             )
         finally:
-            self.state_manager.mark_export_stopped("companies")
-            # Clean up thread reference
-            if "companies" in self.threads:
-                del self.threads["companies"]
+            self._finish_run(entity_type)
 
-    def _export_events_worker(
-        self, batch_save: bool = True, batch_size: int = 10, date_from: str = None, date_to: str = None
-    ):
-        """Worker function for exporting events"""
-        try:
-            self._export_entities_worker(
-                "events", self.api.get_events_page, batch_save, batch_size, date_from, date_to
-            )
-        except Exception as e:
-            log_event(
-                "exporter", "error", f"Error in events export worker: {e}"
-            )
-        finally:
-            self.state_manager.mark_export_stopped("events")
-            # Clean up thread reference
-            if "events" in self.threads:
-                del self.threads["events"]
+    def _finish_run(self, entity_type: str):
+        """Clean up after a worker thread unless a restart already replaced it"""
+        with self._start_lock:
+            run = self._runs.get(entity_type)
+            if run is None or run.thread is not threading.current_thread():
+                return
+            del self._runs[entity_type]
+            self.state_manager.mark_export_stopped(entity_type)
 
     def _export_entities_worker(
         self,
         entity_type: str,
         page_getter: Callable,
+        stop_event: threading.Event,
         batch_save: bool = True,
-        batch_size: int = 10,
+        batch_size: int = 1000,
         date_from: str = None,
         date_to: str = None,
     ):
-        """Generic worker function for exporting entities"""
+        """
+        Generic worker function for exporting entities
 
-        # Get the last processed page from state
+        batch_size is the number of entities buffered before they are written
+        with one append_entities call; the API page size is PAGE_SIZE.
+        """
+
+        # Get the last processed page from state. Saved pages are only
+        # skipped when they were fetched with the same date range; progress
+        # from before ranges were recorded has no range and is kept.
         start_page = self.state_manager.get_last_page(entity_type)
+        saved_range = self.state_manager.get_export_date_range(entity_type)
+        if start_page > 0 and saved_range is not None and saved_range != (date_from, date_to):
+            log_event(
+                "exporter",
+                "info",
+                f"{entity_type} date range changed, starting from page 1",
+            )
+            self.state_manager.reset_export_state(entity_type)
+            start_page = 0
+        self.state_manager.set_export_date_range(entity_type, date_from, date_to)
         current_page = start_page + 1 if start_page > 0 else 1
 
-        # Prepare storage
-        all_entities = (
-            self.storage.get_entities(entity_type) if batch_save else []
-        )
+        # Only the entities fetched since the last save are kept in memory;
+        # append_entities upserts by id, so stored data doesn't need reloading
+        batch = []
         batch_count = 0
 
+        # Batches are written by a separate thread so the next pages are
+        # fetched while the previous batch is being saved. The bounded queue
+        # makes fetching wait if writes fall behind.
+        write_queue: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        writer = threading.Thread(
+            target=self._write_batches,
+            args=(entity_type, write_queue, stop_event),
+            name=f"{entity_type}_writer_thread",
+            daemon=True,
+        )
+        writer.start()
+
+        # Up to max_workers pages are requested ahead of the one being
+        # processed so API latency overlaps; AmoCRMAPI's rate limiter still
+        # spaces the requests. Once a page comes back short the window stops
+        # widening past it, so only the pages already in flight can overshoot
+        # the end; those come back empty and are discarded.
+        fetcher = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=f"{entity_type}_fetch"
+        )
+        pending: dict[int, Future] = {}
+        # First page known to be the last one, None until a short page arrives
+        last_page = None
+
         log_event(
             "exporter",
             "info",
@@ -315,57 +427,75 @@ class ParallelExporter:
 
         # Process pages until no more data or stop flag
         has_more = True
-        while has_more and not self.stop_flags.get(entity_type, False):
-            try:
-                # Get entities for current page
-                entities, has_more = page_getter(current_page, date_from, date_to)
-
-                # Update state
-                self.state_manager.update_export_progress(
-                    entity_type, current_page, not has_more
-                )
-
-                # If batch save is enabled, add to batch
-                if batch_save:
-                    all_entities.extend(entities)
-                    batch_count += 1
-
-                    # Save batch if reached batch size or no more data
-                    if batch_count >= batch_size or not has_more:
-                        self.storage.append_entities(entity_type, all_entities)
-                        log_event(
-                            "exporter",
-                            "info",
-                            f"Saved {len(all_entities)} {entity_type} after "
-                            f"processing {batch_count} pages",
+        failures = 0
+        try:
+            while has_more and not stop_event.is_set():
+                for page, future in pending.items():
+                    if (last_page is None or page < last_page) and _is_last_page(future):
+                        last_page = page
+                for page in range(current_page, current_page + self.max_workers):
+                    if last_page is not None and page > last_page:
+                        break
+                    if page not in pending:
+                        pending[page] = fetcher.submit(
+                            page_getter, page, date_from, date_to
                         )
-                        batch_count = 0
-                else:
-                    # Otherwise, save directly
-                    self.storage.append_entities(entity_type, entities)
-
-                log_event(
-                    "exporter",
-                    "info",
-                    f"Processed {entity_type} page {current_page} with "
-                    f"{len(entities)} items",
-                )
-
-                # Move to next page
-                current_page += 1
-
-            except Exception as e:
-                log_event(
-                    "exporter",
-                    "error",
-                    f"Error processing {entity_type} page {current_page}: {e}",
-                )
-
-                # Wait a bit before retrying
-                time.sleep(5)
-
-        # Ensure final state is saved
-        if has_more:
+                try:
+                    # Get entities for current page
+                    entities, has_more = pending.pop(current_page).result()
+
+                    # Don't record progress for a run that was stopped or
+                    # replaced by a restart while the page was in flight
+                    if stop_event.is_set():
+                        has_more = True
+                        break
+
+                    # If batch save is enabled, add to batch
+                    if batch_save:
+                        batch.extend(entities)
+                        batch_count += 1
+
+                        # Save batch if reached batch size or no more data
+                        if len(batch) >= batch_size or not has_more:
+                            write_queue.put((batch, batch_count, current_page))
+                            batch = []
+                            batch_count = 0
+                    else:
+                        # Otherwise, save directly
+                        write_queue.put((entities, 1, current_page))
+
+                    log_event(
+                        "exporter",
+                        "info",
+                        f"Processed {entity_type} page {current_page} with "
+                        f"{len(entities)} items",
+                    )
+
+                    # Move to next page
+                    current_page += 1
+                    failures = 0
+
+                except Exception as e:
+                    log_event(
+                        "exporter",
+                        "error",
+                        f"Error processing {entity_type} page {current_page}: {e}",
+                    )
+
+                    # Back off before retrying, waking up at once on stop
+                    stop_event.wait(_retry_delay(e, failures))
+                    failures += 1
+        finally:
+            fetcher.shutdown(wait=False, cancel_futures=True)
+            # Save what was fetched before a stop, then wait for the writer
+            if batch:
+                write_queue.put((batch, batch_count, current_page - 1))
+            write_queue.put(None)
+            writer.join()
+
+        # Ensure final state is saved. stop_event is also set by the writer
+        # when a save fails, in which case the export isn't complete.
+        if has_more or stop_event.is_set():
             log_event(
                 "exporter",
                 "info",
@@ -381,16 +511,65 @@ class ParallelExporter:
                 entity_type, current_page - 1, True
             )
 
+    def _write_batches(
+        self,
+        entity_type: str,
+        write_queue: queue.Queue,
+        stop_event: threading.Event,
+    ):
+        """
+        Save batches queued by an export worker until None is received
+
+        Each item is (entities, pages in the batch, last page in the batch).
+        Batches are still saved after stop_event is set, but progress is no
+        longer recorded, so a stopped or replaced run can't overwrite the
+        state of the run that follows it.
+        """
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            batch, batch_count, last_page = item
+            try:
+                if not self.storage.append_entities(entity_type, batch):
+                    # Later batches must not record a page past the one that
+                    # failed, so end the run here; a resume refetches from
+                    # the last stored page
+                    log_event(
+                        "exporter",
+                        "error",
+                        f"Failed to save {entity_type} batch ending at page "
+                        f"{last_page}, stopping export",
+                    )
+                    stop_event.set()
+                    continue
+                log_event(
+                    "exporter",
+                    "info",
+                    f"Saved {len(batch)} {entity_type} after "
+                    f"processing {batch_count} pages",
+                )
+                # Progress is recorded once per saved batch, and only after
+                # the save, so a resume never skips pages that weren't stored
+                if not stop_event.is_set():
+                    self.state_manager.update_export_progress(entity_type, last_page)
+            except Exception as e:
+                # Keep draining so the fetching side never blocks on a dead writer
+                log_event(
+                    "exporter", "error", f"Error saving {entity_type} batch: {e}"
+                )
+
     def stop_export(self, entity_type: str):
         """Stop an export thread"""
-        if entity_type in self.stop_flags:
-            self.stop_flags[entity_type] = True
+        run = self._runs.get(entity_type)
+        if run is not None:
+            run.stop_event.set()
             log_event("exporter", "info", f"Stopping {entity_type} export...")
 
     def stop_all_exports(self):
         """Stop all export threads"""
-        for entity_type in self.stop_flags:
-            self.stop_flags[entity_type] = True
+        for run in list(self._runs.values()):
+            run.stop_event.set()
         log_event("exporter", "info", "Stopping all exports...")
 
     def is_export_running(self, entity_type: str) -> bool:
@@ -414,58 +593,69 @@ class ParallelExporter:
             }
         return status
 
+    def _stop_run(self, entity_type: str, reason: str):
+        """
+        Stop the live run of an export and wait for its worker and writer to
+        finish, so nothing it still had queued lands after the next run starts
+        """
+        # Forget the run, so its thread no longer counts as the live one
+        with self._start_lock:
+            run = self._runs.pop(entity_type, None)
+        if run is None:
+            return
+        run.stop_event.set()
+        log_event("exporter", "info", f"Stopping {entity_type} export for {reason}...")
+        if run.thread is threading.current_thread():
+            return
+        run.thread.join(RUN_JOIN_TIMEOUT)
+        if run.thread.is_alive():
+            log_event(
+                "exporter",
+                "warning",
+                f"Previous {entity_type} export didn't exit within "
+                f"{RUN_JOIN_TIMEOUT}s, starting {reason} anyway",
+            )
+
     def restart_export(self, entity_type: str):
         """Force restart an export regardless of its current state"""
         # First stop any running export
-        if entity_type in self.stop_flags:
-            self.stop_flags[entity_type] = True
-            log_event("exporter", "info", f"Stopping {entity_type} export for restart...")
-
-        # Clear the thread reference if it exists
-        if entity_type in self.threads:
-            del self.threads[entity_type]
+        self._stop_run(entity_type, "restart")
 
         # Make sure it's marked as stopped in the state
         self.state_manager.mark_export_stopped(entity_type)
 
         # Now restart based on entity type
-        export_methods = {
-            "leads": self.export_deals,
-            "contacts": self.export_contacts,
-            "companies": self.export_companies,
-            "events": self.export_events
-        }
-
-        if entity_type in export_methods:
+        method_name = self._EXPORT_METHODS.get(entity_type)
+        if method_name:
             log_event("exporter", "info", f"Restarting {entity_type} export")
-            export_methods[entity_type](force_restart=True)
+            # Start over with the date range the export was running with
+            date_from, date_to = (
+                self.state_manager.get_export_date_range(entity_type) or (None, None)
+            )
+            getattr(self, method_name)(
+                force_restart=True, date_from=date_from, date_to=date_to
+            )
         else:
             log_event("exporter", "error", f"Unknown entity type for restart: {entity_type}")
 
     def resume_export(self, entity_type: str):
         """Resume an export from the last saved page without resetting state"""
         # First stop any running export (if any)
-        if entity_type in self.stop_flags:
-            self.stop_flags[entity_type] = True
-            log_event("exporter", "info", f"Stopping {entity_type} export for resume...")
-
-        # Clear the thread reference if it exists
-        if entity_type in self.threads:
-            del self.threads[entity_type]
+        self._stop_run(entity_type, "resume")
 
         # Make sure it's marked as stopped in the state
         self.state_manager.mark_export_stopped(entity_type)
 
         # Now resume based on entity type (without force_restart)
-        export_methods = {
-            "leads": self.export_deals,
-            "contacts": self.export_contacts,
-            "companies": self.export_companies,
-            "events": self.export_events
-        }
-
-        if entity_type in export_methods:
+        method_name = self._EXPORT_METHODS.get(entity_type)
+        if method_name:
             log_event("exporter", "info", f"Resuming {entity_type} export")
-            export_methods[entity_type](force_restart=False)
+            # Continue with the saved date range, so the saved pages still apply
+            date_from, date_to = (
+                self.state_manager.get_export_date_range(entity_type) or (None, None)
+            )
+            getattr(self, method_name)(
+                force_restart=False, date_from=date_from, date_to=date_to
+            )
         else:
             log_event("exporter", "error", f"Unknown entity type for resume: {entity_type}")
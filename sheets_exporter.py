@@ -125,7 +125,7 @@ class SheetsExporter:
         Returns a dictionary mapping entity types to their spreadsheet URLs
         """
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             log_event("sheets", "info", "Starting Google Sheets export")
 
             self._get_credentials()
@@ -145,17 +145,12 @@ class SheetsExporter:
                     del query["updated_at"]
 
             # Get all entity data with filter
-            entities_data = {
-                "leads": self.storage.get_entities("leads", query=query) or [],
-                "contacts": self.storage.get_entities("contacts", query=query) or [],
-                "companies": self.storage.get_entities("companies", query=query) or [],
-                "events": self.storage.get_entities("events", query=query) or []
-            }
+            entities_data = self.storage.get_all_entities(query=query)
 
             results = {}
             # Process each entity type
             for entity_type, data in entities_data.items():
-                entity_start_time = time.time()
+                entity_start_time = time.perf_counter()
                 try:
                     spreadsheet_id = self.spreadsheet_ids.get(entity_type)
                     if not spreadsheet_id:
@@ -210,14 +205,14 @@ class SheetsExporter:
                     # Store the URL for this entity type
                     results[entity_type] = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
 
-                    entity_time = time.time() - entity_start_time
+                    entity_time = time.perf_counter() - entity_start_time
                     log_event("sheets", "info", f"Exported {entity_type} in {entity_time:.2f} seconds")
 
                 except Exception as sheet_error:
                     log_event("sheets", "error", f"Error exporting {entity_type}: {sheet_error}")
                     log_event("sheets", "error", f"Sheet error stack trace: {traceback.format_exc()}")
 
-            total_time = time.time() - start_time
+            total_time = time.perf_counter() - start_time
             log_event("sheets", "info", f"Completed export in {total_time:.2f} seconds")
             return results
 
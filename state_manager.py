@@ -2,13 +2,45 @@
 State manager for tracking export progress using MongoDB
 """
 
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
 
+import bson
 import config
-from logger import log_event
-from pymongo import MongoClient
+from logger import is_enabled_for, log_event
+from storage import get_client
 from pymongo.errors import PyMongoError
+from pymongo.write_concern import WriteConcern
+
+# State is saved on every exported page, so make it visible when PyMongo
+# was installed without its C extensions and encodes BSON in pure Python
+if not bson.has_c():
+    log_event(
+        "state", "warning",
+        "bson C extension is not available, state saves will be slower"
+    )
+
+_ENTITIES = ("leads", "contacts", "companies", "events")
+
+
+def _fresh_entity_state() -> dict[str, Any]:
+    """Default progress record for a single entity type"""
+    return {
+        "last_page": 0,
+        "completed": False,
+        "last_update": None,
+        "date_range": None,
+    }
+
+
+def _fresh_state() -> dict[str, Any]:
+    """Default state document for all entity types"""
+    state = {entity: _fresh_entity_state() for entity in _ENTITIES}
+    state["global"] = {"last_full_sync": None, "running_exports": []}
+    return state
 
 
 class StateManager:
@@ -20,16 +52,33 @@ class StateManager:
         self.state_file = config.settings.state_file
 
         # Connect to MongoDB
-        self.client = MongoClient(config.settings.mongodb_uri)
+        self.client = get_client()
         self.db = self.client[config.settings.mongodb_db]
         self.state_collection = self.db['export_state']
 
+        # Per-page progress is a heartbeat that gets overwritten by the next
+        # page, so it is acknowledged without waiting for the journal
+        self._state_fast = self.state_collection.with_options(
+            write_concern=WriteConcern(w=1, j=False)
+        )
+
+        # Single writer thread keeps state writes ordered while letting
+        # callers continue without waiting for the MongoDB round-trip
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="state_writer"
+        )
+
         # Initialize state if not exists in MongoDB
         self._ensure_state()
 
         # Load state from MongoDB
         self.state = self._load_state()
 
+        # In-memory mirror of global.running_exports for O(1) lookups
+        self._running: set[str] = set(
+            self.state.get("global", {}).get("running_exports", [])
+        )
+
         # Don't automatically mark exports as stopped on init,
         # let the exporter check and decide which ones to continue
 
@@ -38,26 +87,7 @@ class StateManager:
         # Check if state document exists
         if self.state_collection.count_documents({"_id": "state"}) == 0:
             # Create default state document
-            default_state = {
-                "_id": "state",
-                "leads": {"last_page": 0, "completed": False, "last_update": None},
-                "contacts": {
-                    "last_page": 0,
-                    "completed": False,
-                    "last_update": None,
-                },
-                "companies": {
-                    "last_page": 0,
-                    "completed": False,
-                    "last_update": None,
-                },
-                "events": {
-                    "last_page": 0,
-                    "completed": False,
-                    "last_update": None,
-                },
-                "global": {"last_full_sync": None, "running_exports": []},
-            }
+            default_state = {"_id": "state", **_fresh_state()}
 
             # Insert the default state
             try:
@@ -79,56 +109,65 @@ class StateManager:
             log_event("state", "error", f"Error loading state from MongoDB: {e}")
 
         # Return default state if MongoDB operation failed
-        return {
-            "leads": {"last_page": 0, "completed": False, "last_update": None},
-            "contacts": {
-                "last_page": 0,
-                "completed": False,
-                "last_update": None,
-            },
-            "companies": {
-                "last_page": 0,
-                "completed": False,
-                "last_update": None,
-            },
-            "events": {
-                "last_page": 0,
-                "completed": False,
-                "last_update": None,
-            },
-            "global": {"last_full_sync": None, "running_exports": []},
-        }
+        return _fresh_state()
 
-    def save_state(self):
-        """Save the current state to MongoDB"""
-        try:
-            # Create a copy of state with _id for MongoDB
-            state_to_save = self.state.copy()
-            state_to_save["_id"] = "state"
+    def save_state(self, wait: bool = True, fast: bool = False):
+        """
+        Save the current state to MongoDB
 
+        Writes go through a single background thread so they reach MongoDB
+        in order. With wait=False the call returns as soon as the snapshot
+        is queued. fast=True uses an unjournaled w=1 write concern.
+        """
+        # Snapshot the state so later in-memory changes don't leak into
+        # a write that is still queued
+        state_to_save = copy.deepcopy(self.state)
+        state_to_save["_id"] = "state"
+
+        collection = self._state_fast if fast else self.state_collection
+        self._submit(self._write_state, collection, state_to_save, wait=wait)
+
+    def _submit(self, func, *args, wait: bool = True):
+        """Run a write on the writer thread, optionally waiting for it"""
+        future = self._writer.submit(func, *args)
+        if wait:
+            future.result()
+
+    def _write_state(self, collection, state_to_save: dict[str, Any]):
+        """Write a state snapshot to MongoDB"""
+        try:
             # Use replace_one with upsert to update or create the document
-            self.state_collection.replace_one(
+            collection.replace_one(
                 {"_id": "state"}, state_to_save, upsert=True
             )
         except PyMongoError as e:
             log_event("state", "error", f"Error saving state to MongoDB: {e}")
 
+    def _update_state(self, update: dict[str, Any]):
+        """Apply an atomic update operator to the state document"""
+        try:
+            self.state_collection.update_one({"_id": "state"}, update, upsert=True)
+        except PyMongoError as e:
+            log_event("state", "error", f"Error updating state in MongoDB: {e}")
+
+    def _sync_running_exports(self):
+        """Mirror the in-memory running set into self.state"""
+        self.state.setdefault("global", {})["running_exports"] = list(self._running)
+
     def update_export_progress(
         self, entity_type: str, page: int, completed: bool = False
     ):
         """Update the progress of an export"""
         if entity_type not in self.state:
-            self.state[entity_type] = {
-                "last_page": 0,
-                "completed": False,
-                "last_update": None,
-            }
+            self.state[entity_type] = _fresh_entity_state()
 
         self.state[entity_type]["last_page"] = page
         self.state[entity_type]["completed"] = completed
-        self.state[entity_type]["last_update"] = datetime.now().isoformat()
+        self.state[entity_type]["last_update"] = datetime.now()
 
-        self.save_state()
+        # Per-page progress doesn't need to block the export; the final
+        # (completed) update is written synchronously and journaled
+        self.save_state(wait=completed, fast=not completed)
 
     def get_last_page(self, entity_type: str) -> int:
         """Get the last processed page for an entity type"""
@@ -136,6 +175,33 @@ class StateManager:
             return self.state[entity_type]["last_page"]
         return 0
 
+    def get_export_date_range(
+        self, entity_type: str
+    ) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """
+        Get the (date_from, date_to) the saved progress belongs to, None if
+        no range was recorded
+        """
+        date_range = self.state.get(entity_type, {}).get("date_range")
+        if date_range is None:
+            return None
+        if isinstance(date_range, str):
+            # Older states stored a "from|to" fingerprint
+            date_from, _, date_to = date_range.partition("|")
+            return date_from or None, date_to or None
+        return date_range.get("date_from"), date_range.get("date_to")
+
+    def set_export_date_range(
+        self, entity_type: str, date_from: Optional[str], date_to: Optional[str]
+    ):
+        """Record the date range of the current run, saved with its progress"""
+        if entity_type not in self.state:
+            self.state[entity_type] = _fresh_entity_state()
+        self.state[entity_type]["date_range"] = {
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+
     def is_export_completed(self, entity_type: str) -> bool:
         """Check if an export is completed"""
         if entity_type in self.state:
@@ -145,69 +211,85 @@ class StateManager:
     def reset_export_state(self, entity_type: str):
         """Reset the state for an entity type"""
         if entity_type in self.state:
-            self.state[entity_type] = {
-                "last_page": 0,
-                "completed": False,
-                "last_update": None,
-            }
+            self.state[entity_type] = _fresh_entity_state()
             self.save_state()
 
     def mark_export_running(self, entity_type: str):
         """Mark an export as currently running"""
-        if "global" not in self.state:
-            self.state["global"] = {"running_exports": []}
-
-        if "running_exports" not in self.state["global"]:
-            self.state["global"]["running_exports"] = []
-
-        if entity_type not in self.state["global"]["running_exports"]:
-            self.state["global"]["running_exports"].append(entity_type)
-            self.save_state()
+        if entity_type in self._running:
+            return
+
+        self._running.add(entity_type)
+        self._sync_running_exports()
+        self._submit(
+            self._update_state,
+            {"$addToSet": {"global.running_exports": entity_type}},
+        )
+
+    def mark_exports_running(self, entity_types: List[str]):
+        """Mark several exports as running with a single state update"""
+        started = [entity for entity in entity_types if entity not in self._running]
+        if not started:
+            return
+
+        self._running.update(started)
+        self._sync_running_exports()
+        self._submit(
+            self._update_state,
+            {"$addToSet": {"global.running_exports": {"$each": started}}},
+        )
 
     def mark_export_stopped(self, entity_type: str):
         """Mark an export as stopped"""
-        if (
-            "global" in self.state
-            and "running_exports" in self.state["global"]
-            and entity_type in self.state["global"]["running_exports"]
-        ):
-            self.state["global"]["running_exports"].remove(entity_type)
-            self.save_state()
+        if entity_type not in self._running:
+            return
+
+        self._running.discard(entity_type)
+        self._sync_running_exports()
+        self._submit(
+            self._update_state,
+            {"$pull": {"global.running_exports": entity_type}},
+        )
+
+    def mark_exports_stopped(self, entity_types: List[str]):
+        """Mark several exports as stopped with a single state update"""
+        stopped = [entity for entity in entity_types if entity in self._running]
+        if not stopped:
+            return
+
+        self._running.difference_update(stopped)
+        self._sync_running_exports()
+        self._submit(
+            self._update_state,
+            {"$pull": {"global.running_exports": {"$in": stopped}}},
+        )
 
     def get_running_exports(self) -> List[str]:
         """Get list of currently running exports"""
-        if (
-            "global" in self.state
-            and "running_exports" in self.state["global"]
-        ):
-            return self.state["global"]["running_exports"]
-        return []
+        return list(self._running)
 
     def is_export_running(self, entity_type: str) -> bool:
         """Check if an export is currently running"""
-        running_exports = self.get_running_exports()
-        return entity_type in running_exports
+        return entity_type in self._running
 
     def clear_running_exports(self):
         """Clear all running exports, useful when restarting the server"""
         if "global" in self.state:
-            self.state["global"]["running_exports"] = []
+            self._running.clear()
+            self._sync_running_exports()
             self.save_state()
             log_event("state", "info", "Cleared all running exports from state")
 
     def reset_all_state(self):
         """Reset all export state, including running exports"""
         # Set default state for all entity types
-        for entity_type in ["leads", "contacts", "companies", "events"]:
-            self.state[entity_type] = {
-                "last_page": 0,
-                "completed": False,
-                "last_update": None,
-            }
+        for entity_type in _ENTITIES:
+            self.state[entity_type] = _fresh_entity_state()
 
         # Clear running exports
         if "global" in self.state:
-            self.state["global"]["running_exports"] = []
+            self._running.clear()
+            self._sync_running_exports()
             self.state["global"]["last_full_sync"] = None
 
         self.save_state()
@@ -221,6 +303,7 @@ class StateManager:
         """
         running_exports = self.get_running_exports()
         valid_running = []
+        invalid_running = []
 
         for export in running_exports:
             if export in valid_exports:
@@ -228,12 +311,14 @@ class StateManager:
             else:
                 # This export was marked as running but isn't in the valid list
                 # It might be from a crashed session, so mark it as stopped
-                self.mark_export_stopped(export)
+                invalid_running.append(export)
                 log_event(
                     "state", "warning",
                     f"Export {export} was marked as running but is not valid - marked as stopped"
                 )
 
+        # One round-trip for all orphaned entries
+        self.mark_exports_stopped(invalid_running)
         return valid_running
 
     def is_export_running_in_db(self, entity_type: str) -> bool:
@@ -252,7 +337,7 @@ class StateManager:
                 is_running = entity_type in running_exports
 
                 # Log for debugging
-                if is_running:
+                if is_running and is_enabled_for("debug"):
                     log_event(
                         "state", "debug",
                         f"MongoDB shows {entity_type} is running"
@@ -268,3 +353,16 @@ class StateManager:
             )
             # Fall back to in-memory state
             return self.is_export_running(entity_type)
+
+
+_instance: Optional[StateManager] = None
+_instance_lock = threading.Lock()
+
+
+def get_state_manager() -> StateManager:
+    """Return the process-wide StateManager, creating it on first use"""
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = StateManager()
+        return _instance
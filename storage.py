@@ -3,51 +3,203 @@ Storage module for handling MongoDB collections
 """
 
 from pymongo import MongoClient, ASCENDING
-from pymongo.errors import PyMongoError
+from pymongo.cursor import Cursor
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 from typing import Any
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import threading
+import time
+import weakref
 import pymongo
 
 import config
 from logger import log_event
 
 
+# MongoClient shared by the whole process, see get_client()
+_client: MongoClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """
+    Return the process-wide MongoClient so all Storage/StateManager
+    instances share one connection pool and monitor threads
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                config.settings.mongodb_uri,
+                # zlib is the fallback when zstandard isn't installed
+                compressors="zstd,zlib",
+            )
+        return _client
+
+
+# Entity type -> MongoDB collection name, other types map to themselves
+_COLLECTION_NAMES = {
+    "leads": "deals",
+    "deals": "deals",
+    "contacts": "contacts",
+    "companies": "companies",
+    "events": "events",
+    "logs": "logs",
+}
+
+# Entity counts by collection name, shared by all Storage instances in the
+# process and dropped whenever that collection is written
+_count_cache: dict[str, int] = {}
+# Bumped by every invalidation, so a count read while a write was landing
+# isn't cached after that write dropped the entry
+_count_generation: dict[str, int] = {}
+_count_lock = threading.Lock()
+
+# Log entries are inserted in batches once this many are pending or the
+# oldest pending entry is this many seconds old
+LOG_FLUSH_SIZE = 50
+LOG_FLUSH_INTERVAL = 2.0
+
+# Storage instances whose buffered log entries are flushed at exit. A weak
+# set, so registering doesn't keep instances alive.
+_log_storages: "weakref.WeakSet[Storage]" = weakref.WeakSet()
+
+
+def _flush_all_logs():
+    """Flush the log buffers of all live Storage instances"""
+    for storage in list(_log_storages):
+        storage.flush_logs()
+
+
+atexit.register(_flush_all_logs)
+
+# Logs with datetime timestamps expire through a TTL index; older entries
+# stored with ISO string timestamps are removed by this periodic cleanup
+LOG_CLEANUP_INTERVAL = 3600
+
+
 class Storage:
     """Storage manager for MongoDB collections"""
 
+    # Collections whose indexes were already ensured in this process
+    _indexes_ensured: set[str] = set()
+
     def __init__(self):
         """Initialize the storage manager and MongoDB client"""
-        self.client = MongoClient(config.settings.mongodb_uri)
+        self.client = get_client()
         self.db = self.client[config.settings.mongodb_db]
-        self._ensure_indexes()
+        # Pending log entries, see add_log_entry()
+        self._log_buffer: list[dict[str, Any]] = []
+        self._log_lock = threading.Lock()
+        # Flushes the buffer LOG_FLUSH_INTERVAL seconds after it became non-empty
+        self._log_timer: threading.Timer | None = None
+        self._last_log_cleanup = float("-inf")
+        _log_storages.add(self)
 
-        # Create a test log entry to verify logging is working
+        # Verify connectivity without writing anything
         try:
-            log_collection = self.db['logs']
-            test_log = {
-                "timestamp": datetime.now().isoformat(),
-                "component": "storage",
-                "level": "info",
-                "message": "Test log entry created during initialization"
-            }
-            log_collection.insert_one(test_log)
-            print("Created test log entry in MongoDB")
+            self.client.admin.command("ping")
         except Exception as e:
-            print(f"Error creating test log entry: {e}")
+            print(f"Error connecting to MongoDB: {e}")
+
+        self._ensure_indexes()
 
     def _ensure_indexes(self):
-        """Ensure indexes for entity collections (e.g., on 'id')"""
-        for entity_type in [
-            "leads", "deals", "contacts", "companies", "events", "logs"
-        ]:
-            collection_name = self._get_collection_name(entity_type)
-            print(f"Creating index for collection: {collection_name}")
-            self.db[collection_name].create_index(
-                [("id", ASCENDING)], unique=True, sparse=True
+        """
+        Ensure indexes for entity collections. Entities are keyed by their
+        AmoCRM id in _id, so no separate index on 'id' is needed.
+        """
+        for collection_name in ("deals", "contacts", "companies", "events", "logs", "webhook_events"):
+            if collection_name in Storage._indexes_ensured:
+                continue
+            print(f"Checking indexes for collection: {collection_name}")
+            collection = self.db[collection_name]
+            # One round-trip per collection, indexes are only created when missing
+            indexes = collection.index_information()
+            if collection_name == "logs":
+                self._ensure_ttl_index(
+                    collection, indexes, "timestamp", config.settings.log_retention_days
+                )
+            elif collection_name == "webhook_events":
+                self._ensure_ttl_index(
+                    collection, indexes, "_received_at",
+                    config.settings.webhook_retention_days,
+                )
+            else:
+                # Only entity collections are keyed by AmoCRM id; logs and
+                # webhook events keep their ObjectId _id
+                self._migrate_to_id_keys(collection, indexes)
+            Storage._indexes_ensured.add(collection_name)
+
+    def _migrate_to_id_keys(self, collection, indexes: dict[str, Any]):
+        """
+        Re-key documents stored with an ObjectId _id and a unique 'id' index
+        so that _id holds the entity id, and drop the 'id' index
+
+        Safe to re-run after a crash: copies are only inserted where no
+        document with that _id exists yet, and legacy documents are deleted
+        after all of them were copied.
+        """
+        legacy_filter = {"_id": {"$type": "objectId"}, "id": {"$exists": True}}
+        # The $type query on _id is answered from the _id index
+        if "id_1" not in indexes and collection.find_one(legacy_filter, {"_id": 1}) is None:
+            return
+
+        # The unique 'id' index would reject the copies, drop it first
+        if "id_1" in indexes:
+            collection.drop_index("id_1")
+
+        operations = []
+        migrated = 0
+        for doc in collection.find(legacy_filter):
+            del doc["_id"]
+            # Never overwrite a document already written under the new key
+            operations.append(
+                pymongo.UpdateOne(
+                    {"_id": doc["id"]}, {"$setOnInsert": doc}, upsert=True
+                )
             )
-            if entity_type == "logs":
-                self.db[collection_name].create_index(
-                    [("timestamp", ASCENDING)]
+            if len(operations) >= 1000:
+                collection.bulk_write(operations, ordered=False)
+                migrated += len(operations)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+
+        collection.delete_many(legacy_filter)
+        self._invalidate_count(collection.name)
+        print(f"Migrated {migrated} documents in {collection.name} to id keys")
+
+    def _ensure_ttl_index(
+        self, collection, indexes: dict[str, Any], field: str, retention_days: int
+    ):
+        """Let MongoDB expire documents retention_days after their date field"""
+        expire_after = retention_days * 24 * 60 * 60
+        if indexes.get(f"{field}_1", {}).get("expireAfterSeconds") == expire_after:
+            return
+        try:
+            collection.create_index(
+                [(field, ASCENDING)], expireAfterSeconds=expire_after
+            )
+        except OperationFailure:
+            # The index already exists without a TTL or with a different
+            # retention, update it in place
+            try:
+                self.db.command(
+                    "collMod", collection.name,
+                    index={
+                        "keyPattern": {field: 1},
+                        "expireAfterSeconds": expire_after,
+                    },
+                )
+            except OperationFailure as e:
+                # Not fatal: _clean_old_logs still removes old logs, other
+                # documents are kept until the index is fixed by hand
+                print(
+                    f"Warning: could not set TTL on {collection.name}.{field}: {e}"
                 )
 
     def save_entities(self, entity_type: str, entities: list[dict[str, Any]]) -> bool:
@@ -55,37 +207,49 @@ class Storage:
         try:
             collection = self.db[self._get_collection_name(entity_type)]
 
-            # Instead of delete-then-insert, use ordered=False bulk write with upserts
-            # This will handle duplicate keys gracefully
+            # Diff against what is stored instead of delete-then-insert, so
+            # unchanged documents are not rewritten and readers never see
+            # an empty collection
+            operations = []
             if entities:
-                # First, delete all existing documents
-                collection.delete_many({})
-
-                # Group entities in batches of 500 to avoid too large operations
-                batch_size = 500
-                for i in range(0, len(entities), batch_size):
-                    batch = entities[i:i+batch_size]
-
-                    # Use bulk write with ordered=False to continue on error
-                    operations = []
-                    for entity in batch:
-                        if "id" in entity:
-                            operations.append(
-                                pymongo.UpdateOne(
-                                    {"id": entity["id"]},
-                                    {"$set": entity},
-                                    upsert=True
-                                )
-                            )
-                        else:
-                            operations.append(pymongo.InsertOne(entity))
-
-                    if operations:
-                        collection.bulk_write(operations, ordered=False)
+                # AmoCRM bumps updated_at on every change, use it as the version
+                existing = {
+                    doc["_id"]: doc.get("updated_at")
+                    for doc in collection.find({}, {"updated_at": 1})
+                }
+
+                incoming_ids = set()
+                for entity in entities:
+                    if "id" not in entity:
+                        operations.append(pymongo.InsertOne(entity))
+                        continue
+
+                    entity_id = entity["id"]
+                    incoming_ids.add(entity_id)
+                    version = entity.get("updated_at")
+                    if version is not None and existing.get(entity_id) == version:
+                        continue
+                    operations.append(
+                        pymongo.ReplaceOne({"_id": entity_id}, entity, upsert=True)
+                    )
+
+                # Remove documents that are no longer part of the set
+                stale_ids = [i for i in existing if i not in incoming_ids]
+                for i in range(0, len(stale_ids), 1000):
+                    operations.append(
+                        pymongo.DeleteMany({"_id": {"$in": stale_ids[i:i+1000]}})
+                    )
+
+            # Group operations in batches of 500 to avoid too large operations
+            batch_size = 500
+            for i in range(0, len(operations), batch_size):
+                # Use bulk write with ordered=False to continue on error
+                collection.bulk_write(operations[i:i+batch_size], ordered=False)
 
             log_event(
                 "storage", "info",
-                f"Saved {len(entities)} {entity_type} to MongoDB"
+                f"Saved {len(entities)} {entity_type} to MongoDB "
+                f"({len(operations)} write operations)"
             )
             return True
         except PyMongoError as e:
@@ -94,6 +258,8 @@ class Storage:
                 f"MongoDB error in save_entities: {e}"
             )
             return False
+        finally:
+            self._invalidate_count(self._get_collection_name(entity_type))
 
     def append_entities(self, entity_type: str, entities: list[dict[str, Any]]) -> bool:
         """Append entities to the collection (insert or update by id)"""
@@ -101,11 +267,19 @@ class Storage:
             return True
         try:
             collection = self.db[self._get_collection_name(entity_type)]
-            for entity in entities:
-                if "id" in entity:
-                    collection.replace_one({"id": entity["id"]}, entity, upsert=True)
-                else:
-                    collection.insert_one(entity)
+            operations = [
+                pymongo.ReplaceOne({"_id": entity["id"]}, entity, upsert=True)
+                if "id" in entity
+                else pymongo.InsertOne(entity)
+                for entity in entities
+            ]
+
+            # One round-trip per batch instead of one per entity
+            batch_size = 1000
+            for i in range(0, len(operations), batch_size):
+                collection.bulk_write(
+                    operations[i:i+batch_size], ordered=False
+                )
             log_event(
                 "storage", "info",
                 f"Appended {len(entities)} {entity_type} to MongoDB"
@@ -117,12 +291,50 @@ class Storage:
                 f"MongoDB error in append_entities: {e}"
             )
             return False
+        finally:
+            self._invalidate_count(self._get_collection_name(entity_type))
 
-    def get_entities(self, entity_type: str, query: dict[str, Any] | None = None, limit: int | None = None) -> list[dict[str, Any]]:
-        """Get entities of a specific type from MongoDB with optional filtering and limit"""
+    def append_entity(self, entity_type: str, entity: dict[str, Any]) -> bool:
+        """Insert a single entity without reading or rewriting the collection"""
         try:
             collection = self.db[self._get_collection_name(entity_type)]
-            cursor = collection.find(query or {}, {"_id": 0})
+            collection.insert_one(entity)
+            return True
+        except PyMongoError as e:
+            log_event(
+                "storage", "error",
+                f"MongoDB error in append_entity: {e}"
+            )
+            return False
+        finally:
+            self._invalidate_count(self._get_collection_name(entity_type))
+
+    def get_entities(
+        self,
+        entity_type: str,
+        query: dict[str, Any] | None = None,
+        limit: int | None = None,
+        projection: dict[str, Any] | None = None,
+        as_list: bool = True,
+        batch_size: int | None = None,
+    ) -> list[dict[str, Any]] | Cursor:
+        """
+        Get entities of a specific type from MongoDB with optional filtering and limit
+
+        Args:
+            projection: Extra fields to include or exclude, _id is always excluded
+            as_list: When False, return the cursor so large results can be
+                iterated without loading them all. Errors raised while
+                iterating the cursor are left to the caller.
+            batch_size: Documents per getMore round-trip, None keeps the
+                server default (101 in the first batch, then up to 16MB)
+        """
+        collection_name = self._get_collection_name(entity_type)
+        if collection_name == "logs":
+            self.flush_logs()
+        try:
+            collection = self.db[collection_name]
+            cursor = collection.find(query or {}, {**(projection or {}), "_id": 0})
 
             # Sort by timestamp descending for logs
             if entity_type == "logs":
@@ -132,7 +344,10 @@ class Storage:
             if limit:
                 cursor = cursor.limit(limit)
 
-            return list(cursor)
+            if batch_size:
+                cursor = cursor.batch_size(batch_size)
+
+            return list(cursor) if as_list else cursor
         except PyMongoError as e:
             log_event(
                 "storage", "error",
@@ -140,11 +355,42 @@ class Storage:
             )
             return []
 
+    def get_all_entities(
+        self, query: dict[str, Any] | None = None
+    ) -> dict[str, list[dict[str, Any]]]:
+        """
+        Get leads, contacts, companies and events matching the same query,
+        keyed by entity type. The four finds run concurrently.
+        """
+        entity_types = ("leads", "contacts", "companies", "events")
+        with ThreadPoolExecutor(max_workers=len(entity_types)) as executor:
+            futures = {
+                entity_type: executor.submit(self.get_entities, entity_type, query=query)
+                for entity_type in entity_types
+            }
+        return {
+            entity_type: future.result() or [] for entity_type, future in futures.items()
+        }
+
     def update_entity(self, entity_type: str, entity_id: int, entity_data: dict[str, Any]) -> bool:
         """Update a specific entity or add it if it doesn't exist"""
+        collection_name = self._get_collection_name(entity_type)
         try:
-            collection = self.db[self._get_collection_name(entity_type)]
-            result = collection.replace_one({"id": entity_id}, entity_data, upsert=True)
+            collection = self.db[collection_name]
+            query: dict[str, Any] = {"_id": entity_id}
+            version = entity_data.get("updated_at")
+            if version is not None:
+                # A stored copy with the same updated_at does not match, so
+                # the upsert collides on _id instead of rewriting the document
+                query["updated_at"] = {"$ne": version}
+            try:
+                result = collection.replace_one(query, entity_data, upsert=True)
+            except DuplicateKeyError:
+                log_event(
+                    "storage", "debug",
+                    f"{entity_type} with ID {entity_id} is unchanged, skipping write"
+                )
+                return True
             if result.matched_count:
                 log_event(
                     "storage", "info",
@@ -162,12 +408,15 @@ class Storage:
                 f"MongoDB error in update_entity: {e}"
             )
             return False
+        finally:
+            self._invalidate_count(collection_name)
 
     def delete_entity(self, entity_type: str, entity_id: int) -> bool:
         """Delete a specific entity by id"""
+        collection_name = self._get_collection_name(entity_type)
         try:
-            collection = self.db[self._get_collection_name(entity_type)]
-            result = collection.delete_one({"id": entity_id})
+            collection = self.db[collection_name]
+            result = collection.delete_one({"_id": entity_id})
             if result.deleted_count:
                 log_event(
                     "storage", "info",
@@ -186,59 +435,124 @@ class Storage:
                 f"MongoDB error in delete_entity: {e}"
             )
             return False
+        finally:
+            self._invalidate_count(collection_name)
 
     def get_entity_count(self, entity_type: str) -> int:
         """Get the count of entities of a specific type"""
+        collection_name = self._get_collection_name(entity_type)
+        if collection_name == "logs":
+            self.flush_logs()
+        with _count_lock:
+            count = _count_cache.get(collection_name)
+            generation = _count_generation.get(collection_name, 0)
+        if count is not None:
+            return count
         try:
-            collection = self.db[self._get_collection_name(entity_type)]
-            return collection.count_documents({})
+            # Unfiltered count, read from collection metadata instead of
+            # scanning like count_documents({}) does
+            count = self.db[collection_name].estimated_document_count()
         except PyMongoError as e:
             log_event("storage", "error", f"MongoDB error in get_entity_count: {e}")
             return 0
+        with _count_lock:
+            if _count_generation.get(collection_name, 0) == generation:
+                _count_cache[collection_name] = count
+        return count
+
+    def _invalidate_count(self, collection_name: str):
+        """Drop the memoized count after a collection has been written"""
+        with _count_lock:
+            _count_cache.pop(collection_name, None)
+            _count_generation[collection_name] = (
+                _count_generation.get(collection_name, 0) + 1
+            )
 
     def _get_collection_name(self, entity_type: str) -> str:
         """Map entity type to MongoDB collection name"""
-        if entity_type == "leads" or entity_type == "deals":
-            return "deals"
-        elif entity_type == "contacts":
-            return "contacts"
-        elif entity_type == "companies":
-            return "companies"
-        elif entity_type == "events":
-            return "events"
-        elif entity_type == "logs":
-            return "logs"
-        else:
-            return entity_type
+        return _COLLECTION_NAMES.get(entity_type, entity_type)
 
     def add_log_entry(self, entry: dict[str, Any]) -> bool:
-        """Add an entry to the logs collection"""
+        """
+        Add an entry to the logs collection
+
+        Entries are buffered and written with insert_many once
+        LOG_FLUSH_SIZE entries are pending or LOG_FLUSH_INTERVAL seconds
+        have passed. Errors, reads of the logs collection and process
+        exit flush immediately.
+        """
+        if "timestamp" not in entry:
+            entry["timestamp"] = datetime.now()
+
+        with self._log_lock:
+            if not self._log_buffer:
+                # Entries logged before a quiet period still get written
+                # even if nothing else is logged after them
+                self._log_timer = threading.Timer(LOG_FLUSH_INTERVAL, self.flush_logs)
+                self._log_timer.daemon = True
+                self._log_timer.start()
+            self._log_buffer.append(entry)
+            flush = (
+                len(self._log_buffer) >= LOG_FLUSH_SIZE
+                or entry.get("level") == "error"
+            )
+
+        if flush:
+            return self.flush_logs()
+        return True
+
+    def flush_logs(self) -> bool:
+        """Insert all buffered log entries"""
+        with self._log_lock:
+            entries, self._log_buffer = self._log_buffer, []
+            if self._log_timer is not None:
+                self._log_timer.cancel()
+                self._log_timer = None
+        if not entries:
+            return True
+
         try:
             collection = self.db[self._get_collection_name("logs")]
-            if "timestamp" not in entry:
-                entry["timestamp"] = datetime.now().isoformat()
-            collection.insert_one(entry)
-            self._clean_old_logs()
+            collection.insert_many(entries, ordered=False)
+            self._invalidate_count(collection.name)
+            if time.monotonic() - self._last_log_cleanup >= LOG_CLEANUP_INTERVAL:
+                self._last_log_cleanup = time.monotonic()
+                self._clean_old_logs()
             return True
         except PyMongoError as e:
             # Don't use log_event to avoid circular reference
-            print(f"ERROR: MongoDB error in add_log_entry: {e}")
+            print(f"ERROR: MongoDB error in flush_logs: {e}")
             return False
 
     def _clean_old_logs(self):
-        """Remove log entries older than the retention period"""
+        """
+        Remove log entries older than the retention period. Normally the TTL
+        index expires datetime timestamps and this only catches entries with
+        ISO string timestamps, but it covers both in case the index is missing.
+        """
         try:
             retention_date = datetime.now().timestamp() - (
                 config.settings.log_retention_days * 24 * 60 * 60
             )
-            cutoff = datetime.fromtimestamp(retention_date).isoformat()
+            cutoff = datetime.fromtimestamp(retention_date)
             collection = self.db[self._get_collection_name("logs")]
-            collection.delete_many({"timestamp": {"$lt": cutoff}})
+            # $lt only compares values of the same BSON type, so dates and
+            # strings each need their own cutoff
+            result = collection.delete_many({
+                "$or": [
+                    {"timestamp": {"$lt": cutoff}},
+                    {"timestamp": {"$lt": cutoff.isoformat()}},
+                ]
+            })
+            if result.deleted_count:
+                self._invalidate_count(collection.name)
         except Exception as e:
             log_event("storage", "error", f"MongoDB error in _clean_old_logs: {e}")
 
     def get_statistics(self) -> dict[str, Any]:
         """Get statistics about stored data"""
+        # Counts are memoized until the collection is written, so reading
+        # them one after another is cheaper than fanning out to threads
         return {
             "deals": self.get_entity_count("leads"),
             "contacts": self.get_entity_count("contacts"),